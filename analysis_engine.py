@@ -0,0 +1,1025 @@
+import csv
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from csv_ingest import BACKENDS, read_column, read_header
+
+# Configuration
+API_URL = "https://llama3-inference.uat.glacio.intcx.net/v1/chat/completions"
+# Optional comma-separated replicas. Requests sharing a prompt prefix go to a
+# small stable set of them (LLM_PREFIX_REPLICAS) so their prefix (KV) caches stay
+# warm while a single-prefix run still spreads over more than one replica.
+API_URLS = [u.strip() for u in os.environ.get("LLM_API_URLS", API_URL).split(",") if u.strip()]
+PREFIX_REPLICAS = int(os.environ.get("LLM_PREFIX_REPLICAS", "2"))
+MODEL = "llama3"
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 10.0  # requests/sec across all workers (was a 0.1s sleep per call)
+DEFAULT_TEXT_COLUMNS = ['body', 'comment', 'comments', 'text', 'content']
+EXTRA_KEY_TOKENS = 60  # output budget added per key merged into a combined prompt
+DEFAULT_SIZE_STATS = "output_size_stats.json"
+
+# Retry policy per error class (see classify_error). 'inline' retries happen
+# straight away in the main pass (backoff doubles from 'backoff' seconds);
+# 'temperature' / 'max_tokens_factor' adjust the retried request; 'defer' re-queues
+# the text for the deferred pass at the end of the run. Timeouts and 429s are not
+# retried inline, so an overloaded replica doesn't tie up a worker for the whole
+# timeout again.
+RETRY_POLICIES = {
+    "timeout": {"inline": 0, "defer": True},
+    "http_429": {"inline": 0, "defer": True},
+    "http_5xx": {"inline": 1, "backoff": 0.5, "defer": True},
+    "http_4xx": {"inline": 0, "defer": False},
+    "connection": {"inline": 1, "backoff": 0.5, "defer": True},
+    "retries_exhausted": {"inline": 0, "defer": True},
+    "parse": {"inline": 1, "temperature": 0.0, "defer": True},
+    "truncated": {"inline": 1, "max_tokens_factor": 2, "defer": True},
+    # Partial JSON recovered from a truncated answer: kept, and retried in full later
+    "salvaged": {"inline": 0, "max_tokens_factor": 2, "defer": True},
+    "default": {"inline": 0, "defer": True},
+}
+DEFERRED_RETRIES = 2  # attempts per failed text in the deferred pass
+DEFERRED_BACKOFF = 2.0  # seconds before the second deferred attempt, doubling
+DEFERRED_TIMEOUT_FACTOR = 2.0
+HEDGE_PERCENTILE = 95  # send a duplicate request once the first is slower than this
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_FRACTION = 0.05  # at most this share of calls is hedged
+PROGRESS_INTERVAL = 5.0  # seconds between run_tasks progress callbacks
+
+# Task name -> module exposing build_task(**options). Modules are imported on
+# demand so a run only loads what its task needs.
+TASK_MODULES = {
+    "sentiment-lite": "process_sentiment_v2",
+    "nlp": "nlp_processor",
+}
+
+# Disable insecure request warnings
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def setup_requests_session(pool_size=DEFAULT_WORKERS):
+    """
+    Sets up a requests session with a connection pool sized for the workers.
+    Only connection setup is retried here; urllib3 never retries a POST on a
+    status code or read error, so those go through RETRY_POLICIES instead.
+    """
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=2,
+        connect=2,
+        read=False,
+        status=0,
+        backoff_factor=0.5,
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def extract_json(text):
+    """Robustly extracts JSON from potentially conversational model output."""
+    try:
+        # Find the first '{' and last '}'
+        start = text.find('{')
+        end = text.rfind('}') + 1
+        if start != -1 and end != 0:
+            json_str = text[start:end]
+            # Remove potential markdown formatting inside the matches
+            json_str = json_str.replace("```json", "").replace("```", "").strip()
+            return json.loads(json_str)
+        return None
+    except Exception:
+        return None
+
+
+def salvage_json(text, max_cuts=50):
+    """
+    Recovers the complete part of a truncated JSON object. Only whole members
+    are kept: complete top-level members, plus the complete elements of a
+    top-level array (e.g. the entities returned before the cut). A truncated
+    trailing member or element is dropped rather than kept half-filled.
+    Returns a dict or None.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    stack, cuts = [], []
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                break
+            if stack == ['}', ']']:
+                # A complete element of a top-level array
+                cuts.append((i + 1, "]}"))
+        elif ch == ',' and len(stack) == 1:
+            cuts.append((i, "}"))
+    for end, closing in reversed(cuts[-max_cuts:]):
+        try:
+            result = json.loads(text[start:end] + closing)
+        except ValueError:
+            continue
+        if isinstance(result, dict):
+            return result
+    return None
+
+
+def detect_text_column(fieldnames, candidates=DEFAULT_TEXT_COLUMNS, required=False):
+    """
+    Returns the first fieldname matching a candidate (case-insensitive), else the
+    first column (None if `required`).
+    """
+    if not fieldnames:
+        return None
+    lowered = {c.lower(): c for c in reversed(fieldnames)}
+    for target in candidates:
+        if target in lowered:
+            return lowered[target]
+    return None if required else fieldnames[0]
+
+
+def read_texts(input_file, candidates=DEFAULT_TEXT_COLUMNS, keep_empty=False, limit=None, backend="mmap",
+               required=False):
+    """
+    Reads the text column of a CSV via csv_ingest (memory-mapped, chunked, tuple rows).
+    With `required`, a file without a candidate column is an error instead of
+    falling back to its first column.
+    Returns a list of strings (None if the file has no header or no such column).
+    """
+    header = read_header(input_file)
+    if not header:
+        print(f"Error: No header found in {input_file}.")
+        return None
+    col_name = detect_text_column(list(header), candidates, required)
+    if col_name is None:
+        print(f"Error: Could not find a {'/'.join(candidates)} column in {input_file}. Available: {list(header)}")
+        return None
+    print(f"Using column: '{col_name}'")
+    return read_column(input_file, col_name, keep_empty, limit, backend)
+
+
+class RateLimiter:
+    """Spaces calls evenly across threads to at most `rate` per second."""
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """
+    Thread-safe cache of parsed model results keyed by task and prompt.
+    If `path` is given, entries are loaded from and appended to a JSON-lines file.
+    With `max_entries`, the least recently used entries are evicted from memory.
+    """
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._store(entry["key"], entry["result"])
+                    except (ValueError, KeyError):
+                        continue
+
+    def _store(self, key, result):
+        self._data[key] = result
+        self._data.move_to_end(key)
+        if self.max_entries and len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._store(key, result)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"key": key, "result": result}) + "\n")
+
+
+def load_task(name, **options):
+    """Imports the module for task `name` and returns its task definition."""
+    if name not in TASK_MODULES:
+        raise ValueError(f"Unknown task '{name}'. Available: {', '.join(TASK_MODULES)}")
+    module = importlib.import_module(TASK_MODULES[name])
+    return module.build_task(**options)
+
+
+def split_user_template(template):
+    """
+    Splits a task's user template into (prefix, suffix) around '{text}'.
+    Everything before the text is part of the cacheable prompt prefix.
+    """
+    if template.count("{text}") != 1:
+        raise ValueError(f"user_template must contain '{{text}}' exactly once: {template!r}")
+    prefix, suffix = template.split("{text}")
+    return prefix, suffix
+
+
+def prompt_prefix_id(task):
+    """Stable id of the byte-identical prefix (system prompt + user prefix) shared by a task's requests."""
+    prefix, _ = split_user_template(task["user_template"])
+    return ResponseCache.make_key(task["system_prompt"], prefix)
+
+
+def replicas_for(task):
+    """
+    Every endpoint, ranked for the task's prompt prefix by rendezvous hashing:
+    stable per prefix, and adding or removing a replica only moves the prefixes
+    that ranked it near the top.
+    """
+    prefix_id = prompt_prefix_id(task)
+    return sorted(API_URLS, key=lambda url: ResponseCache.make_key(prefix_id, url), reverse=True)
+
+
+def endpoint_for(task, text=""):
+    """Prefix affinity: requests go to the prefix's top PREFIX_REPLICAS replicas, spread by text."""
+    if len(API_URLS) == 1:
+        return API_URLS[0]
+    ranked = replicas_for(task)[:max(1, PREFIX_REPLICAS)]
+    return ranked[int(ResponseCache.make_key(text), 16) % len(ranked)]
+
+
+def build_payload(task, text):
+    """
+    Builds the chat payload with the static parts first and the text last, so
+    every request of a task shares a byte-stable prefix for server prefix caching.
+    """
+    prefix, suffix = split_user_template(task["user_template"])
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": task["system_prompt"]},
+            {"role": "user", "content": prefix + text + suffix}
+        ],
+        "temperature": task["temperature"],
+        "max_tokens": task["max_tokens"]
+    }
+
+
+class OutputSizeStats:
+    """
+    Observed completion-token counts per field set ('size_key'), persisted as JSON.
+    Used to set max_tokens from the observed distribution instead of a fixed budget.
+    """
+    MIN_SAMPLES = 20
+    WINDOW = 500
+    HEADROOM = 1.25
+
+    def __init__(self, path=DEFAULT_SIZE_STATS):
+        self.path = path
+        self.samples = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.samples = json.load(f)
+            except ValueError:
+                self.samples = {}
+
+    def observe(self, key, tokens):
+        with self._lock:
+            values = self.samples.setdefault(key, [])
+            values.append(int(tokens))
+            del values[:-self.WINDOW]
+
+    def max_tokens(self, key, default):
+        """p99 of observed sizes plus headroom once enough samples exist, else `default`."""
+        with self._lock:
+            values = sorted(self.samples.get(key, []))
+        if len(values) < self.MIN_SAMPLES:
+            return default
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        return max(64, min(2 * default, int(p99 * self.HEADROOM) + 16))
+
+    def mean(self, key):
+        """Mean observed completion tokens for `key`, or None without samples."""
+        with self._lock:
+            values = self.samples.get(key, [])
+            return sum(values) / len(values) if values else None
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.samples, f)
+
+
+class UsageStats:
+    """Thread-safe totals of server-reported token usage and request latency."""
+
+    def __init__(self, sizes=None):
+        self.totals = Counter()
+        self.sizes = sizes
+        self.latencies_ms = []
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def note_error(self, error_class):
+        """Counts a failure that happened after a successful HTTP call (e.g. unparseable output)."""
+        with self._lock:
+            self.errors[error_class] += 1
+
+    def count(self, name):
+        """Counts an event such as an inline retry or a salvaged partial result."""
+        with self._lock:
+            self.totals[name] += 1
+
+    def record_error(self, error_class, latency):
+        with self._lock:
+            self.totals["failed_calls"] += 1
+            self.errors[error_class] += 1
+            self.latencies_ms.append(latency * 1000)
+
+    def record(self, usage, latency, task=None, truncated=False):
+        usage = usage or {}
+        details = usage.get("prompt_tokens_details") or {}
+        if self.sizes is not None and task and task.get("size_key") and usage.get("completion_tokens"):
+            # A truncated answer under-reports what the field set needs; bias it upward
+            observed = task["max_tokens"] * 1.5 if truncated else usage["completion_tokens"]
+            self.sizes.observe(task["size_key"], observed)
+        with self._lock:
+            self.totals["truncated"] += int(truncated)
+            self.totals["calls"] += 1
+            self.totals["latency_ms"] += int(latency * 1000)
+            self.latencies_ms.append(latency * 1000)
+            self.totals["prompt_tokens"] += usage.get("prompt_tokens", 0) or 0
+            self.totals["completion_tokens"] += usage.get("completion_tokens", 0) or 0
+            # OpenAI-style servers (incl. vLLM) report prefix-cache hits here
+            self.totals["cached_tokens"] += details.get("cached_tokens", 0) or 0
+
+    def summary(self):
+        t = self.totals
+        cached_pct = 100.0 * t["cached_tokens"] / t["prompt_tokens"] if t["prompt_tokens"] else 0.0
+        avg_ms = t["latency_ms"] / t["calls"] if t["calls"] else 0.0
+        return (f"{t['calls']} calls, {t['prompt_tokens']} prompt tokens ({cached_pct:.1f}% prefix-cached), "
+                f"{t['completion_tokens']} completion tokens, {avg_ms:.0f} ms avg latency")
+
+
+class HedgedRequests:
+    """
+    Tail-latency hedging: when a request has not answered within the observed
+    HEDGE_PERCENTILE latency, a duplicate is sent (to `alternate`, another replica
+    of the prefix, if given) and the first successful response wins. Hedges bypass the rate
+    limiter, so they are capped at HEDGE_MAX_FRACTION of calls.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, percentile=HEDGE_PERCENTILE,
+                 min_samples=HEDGE_MIN_SAMPLES, max_fraction=HEDGE_MAX_FRACTION):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_fraction = max_fraction
+        self.latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.hedged = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+        # Losing requests finish in the background, so leave room beyond the workers
+        self._executor = ThreadPoolExecutor(max_workers=workers * 2)
+
+    def observe(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def _delay(self):
+        """Seconds to wait before hedging this call, or None to not hedge it."""
+        with self._lock:
+            self.calls += 1
+            if len(self.latencies) < self.min_samples or self.hedged >= self.max_fraction * self.calls:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))]
+
+    def post(self, session, url, payload, timeout, alternate=None):
+        delay = self._delay()
+        if delay is None:
+            return session.post(url, json=payload, verify=False, timeout=timeout)
+
+        primary = self._executor.submit(session.post, url, json=payload, verify=False, timeout=timeout)
+        try:
+            return primary.result(timeout=delay)
+        except FuturesTimeout:
+            pass
+
+        with self._lock:
+            self.hedged += 1
+        backup = self._executor.submit(session.post, alternate or url, json=payload, verify=False, timeout=timeout)
+        pending = {primary, backup}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self.wins += 1
+                    return future.result()
+        return primary.result()  # both failed; re-raise the original error
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def retry_policy(error_class):
+    """RETRY_POLICIES entry for an error class; HTTP statuses fall back to http_4xx/http_5xx."""
+    if error_class in RETRY_POLICIES:
+        return RETRY_POLICIES[error_class]
+    if error_class.startswith("http_"):
+        return RETRY_POLICIES["http_5xx" if error_class.startswith("http_5") else "http_4xx"]
+    return RETRY_POLICIES["default"]
+
+
+def classify_error(exc):
+    """Short error class for a failed call, used in run stats."""
+    if isinstance(exc, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return f"http_{exc.response.status_code}"
+    if isinstance(exc, requests.exceptions.RetryError):
+        return "retries_exhausted"
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return "connection"
+    if isinstance(exc, requests.exceptions.RequestException):
+        return "request"
+    return type(exc).__name__
+
+
+def call_model(session, task, text, usage=None, hedge=None, timeout=None):
+    """
+    Sends one prepared text to the API once.
+    Returns (result, error_class): the parsed result and None on success, otherwise
+    the task's error result (or JSON salvaged from a truncated answer) and its class.
+    """
+    started = time.monotonic()
+    url, payload = endpoint_for(task, text), build_payload(task, text)
+    timeout = timeout or task["timeout"]
+    try:
+        if hedge is not None:
+            alternate = next((u for u in replicas_for(task) if u != url), url)
+            response = hedge.post(session, url, payload, timeout, alternate)
+        else:
+            response = session.post(url, json=payload, verify=False, timeout=timeout)
+        response.raise_for_status()
+
+        data = response.json()
+        latency = time.monotonic() - started
+        if hedge is not None:
+            hedge.observe(latency)
+        truncated = data['choices'][0].get('finish_reason') == "length"
+        if usage is not None:
+            usage.record(data.get("usage"), latency, task, truncated)
+        content = data['choices'][0]['message']['content']
+
+        result = task["parse"](content)
+        if result is not None:
+            return result, None
+        if truncated:
+            partial = salvage_json(content)
+            keys = task.get("keys") or []
+            if partial is not None and (not keys or keys[0] in partial):
+                if usage is not None:
+                    usage.count("salvaged")
+                return partial, "salvaged"
+        error_class = "truncated" if truncated else "parse"
+        if usage is not None:
+            usage.note_error(error_class)
+        return task["error_result"](f"Failed to parse JSON from model output: {content[:100]}..."), error_class
+
+    except requests.exceptions.RequestException as e:
+        error_class = classify_error(e)
+        if usage is not None:
+            usage.record_error(error_class, time.monotonic() - started)
+        return task["error_result"](f"API Request failed: {str(e)}"), error_class
+    except Exception as e:
+        error_class = classify_error(e)
+        if usage is not None:
+            usage.record_error(error_class, time.monotonic() - started)
+        return task["error_result"](f"Unexpected error: {str(e)}"), error_class
+
+
+def call_with_retries(session, task, text, usage=None, limiter=None, hedge=None, retry_of=None):
+    """
+    call_model() under RETRY_POLICIES. In the main pass (retry_of=None) only the
+    policy's inline retries are made. A deferred retry of a text that failed with
+    class `retry_of` makes DEFERRED_RETRIES attempts with a longer timeout.
+    Returns the result dict; failures and salvaged results carry an 'error_class' key.
+    """
+    error_class = retry_of
+    kept = None
+    attempt = 0
+    while True:
+        policy = retry_policy(error_class) if error_class else {}
+        attempt_task = task
+        if "temperature" in policy or "max_tokens_factor" in policy:
+            attempt_task = dict(task)
+            attempt_task["temperature"] = policy.get("temperature", task["temperature"])
+            attempt_task["max_tokens"] = int(task["max_tokens"] * policy.get("max_tokens_factor", 1))
+        timeout = task["timeout"] * DEFERRED_TIMEOUT_FACTOR if retry_of else None
+
+        if limiter:
+            limiter.acquire()
+        result, new_class = call_model(session, attempt_task, text, usage, hedge, timeout)
+        if new_class is None:
+            return result
+        if kept is None or kept["error_class"] != "salvaged" or new_class == "salvaged":
+            # Never trade a partial result for an error
+            result["error_class"] = new_class
+            kept = result
+        error_class = new_class
+
+        policy = retry_policy(new_class)
+        if retry_of:
+            allowed, delay = DEFERRED_RETRIES - 1, DEFERRED_BACKOFF * 2 ** attempt
+        else:
+            allowed, delay = policy["inline"], policy.get("backoff", 0.0) * 2 ** attempt
+        if attempt >= allowed or (retry_of and not policy["defer"]):
+            return kept
+        attempt += 1
+        if usage is not None:
+            usage.count("deferred_retries" if retry_of else "retries")
+        time.sleep(delay)
+
+
+def finish_result(task, text, result):
+    """
+    Runs the task's postprocess and a trial flatten on `result` (a copy the caller
+    owns). Model output the task can't handle (e.g. entities that are plain
+    strings) becomes the task's error result with error class 'parse'.
+    """
+    try:
+        if task.get("postprocess"):
+            result = task["postprocess"](text, result)
+        if task.get("flatten"):
+            task["flatten"](text, result)
+        return result
+    except Exception as e:
+        error = task["error_result"](f"Malformed model output: {type(e).__name__}: {e}")
+        error["error_class"] = "parse"
+        return error
+
+
+def analyze_text(session, task, text, cache=None, limiter=None, usage=None, hedge=None, retry_of=None):
+    """
+    Runs `task` on one text: local short-circuits first, then the cache, then the model.
+    Returns the task's result dict. Results that failed (or were only partly
+    salvaged) carry an 'error_class' key and are not cached; see call_with_retries().
+    A model answer is cached only once postprocessing it has succeeded.
+    """
+    prepared = task["prepare"](text)
+    if not prepared:
+        return task["skip_result"](text)
+
+    if task.get("local_first"):
+        local = task["local_first"](prepared)
+        if local is not None:
+            return local
+
+    key = ResponseCache.make_key(task["name"], task["system_prompt"], prepared)
+    cached = cache.get(key) if cache else None
+    raw = cached if cached is not None else call_with_retries(session, task, prepared, usage, limiter, hedge, retry_of)
+
+    # Copy so cached entries are never mutated by per-text postprocessing
+    result = finish_result(task, prepared, json.loads(json.dumps(raw)))
+    if cached is None and cache and "error_class" not in result and not task["is_error"](result):
+        cache.put(key, raw)
+    return result
+
+
+def _prepare_all(tasks, text):
+    for task in tasks:
+        text = task["prepare"](text)
+        if not text:
+            return ""
+    return text
+
+
+def combine_tasks(tasks):
+    """
+    Builds one task whose single request answers every task in `tasks`.
+    The task reading the most keys supplies the prompt; keys only the others read
+    are appended using their 'key_hints'. The raw parsed JSON (or {"_error": reason})
+    is split per task by split_result() in the combined task's postprocess, so a
+    result only reaches the cache once every task has accepted it.
+    The text column comes from the same task as the prompt, and every task's
+    'prepare' is applied in turn so each keeps its own cleaning and truncation.
+    """
+    base = max(tasks, key=lambda t: len(t["keys"]))
+    extra = []
+    for task in tasks:
+        for key in task["keys"]:
+            if key not in base["keys"] and key not in [k for k, _ in extra]:
+                extra.append((key, task.get("key_hints", {}).get(key, '"string"')))
+
+    system_prompt = base["system_prompt"]
+    if extra:
+        lines = ",\n".join(f'  "{key}": {hint}' for key, hint in extra)
+        system_prompt += f"\n\nAlso include these additional top-level keys in the same JSON object:\n{lines}"
+
+    combined = {
+        "name": "+".join(t["name"] for t in tasks),
+        "system_prompt": system_prompt,
+        "user_template": base["user_template"],
+        "temperature": base["temperature"],
+        "max_tokens": base["max_tokens"] + EXTRA_KEY_TOKENS * len(extra),
+        "size_key": "+".join(t.get("size_key", t["name"]) for t in tasks),
+        "timeout": max(t["timeout"] for t in tasks),
+        "columns": base["columns"],
+        "require_column": base.get("require_column", False),
+        "keep_empty": any(t["keep_empty"] for t in tasks),
+        "prepare": lambda text: _prepare_all(tasks, text),
+        "skip_result": lambda text: {"_skipped": True},
+        "parse": base["parse"],
+        "error_result": lambda reason: {"_error": reason},
+        "is_error": lambda result: "_error" in result,
+        "fieldnames": [],
+        "keys": base["keys"] + [key for key, _ in extra],
+        "tasks": tasks,
+    }
+
+    def postprocess(text, result):
+        split = split_result(combined, text, result)
+        processed = {"_split": split}
+        if result.get("error_class"):
+            processed["error_class"] = result["error_class"]
+        elif any("error_class" in r for r in split.values()):
+            processed["error_class"] = "parse"
+        return processed
+
+    combined["postprocess"] = postprocess
+    return combined
+
+
+def split_result(combined, text, result):
+    """Turns a combined result into {task name: that task's result}; see finish_result()."""
+    split = {}
+    for task in combined["tasks"]:
+        if "_skipped" in result:
+            split[task["name"]] = task["skip_result"](text)
+        elif "_error" in result:
+            split[task["name"]] = task["error_result"](result["_error"])
+        else:
+            split[task["name"]] = finish_result(task, text, json.loads(json.dumps(result)))
+    return split
+
+
+def _output_fieldnames(task):
+    """A task's output columns plus 'error_class', which marks failed and partial rows."""
+    return task["fieldnames"] + ["error_class"]
+
+
+def _output_rows(task, text, result):
+    rows = task["flatten"](text, result)
+    for row in rows:
+        row["error_class"] = result.get("error_class", "")
+    return rows
+
+
+def _rewrite_rows(path, fieldnames, replacements):
+    """
+    Streams `path` into a new file, replacing row spans: `replacements` maps the
+    index of a span's first data row -> (rows in the span, new row dicts).
+    """
+    tmp_path = path + ".tmp"
+    with open(path, 'r', newline='', encoding='utf-8') as src, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        dict_writer = csv.DictWriter(dst, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writerow(next(reader))
+        skip = 0
+        for i, row in enumerate(reader):
+            if skip:
+                skip -= 1
+            elif i in replacements:
+                count, new_rows = replacements[i]
+                dict_writer.writerows(new_rows)
+                skip = count - 1
+            else:
+                writer.writerow(row)
+    os.replace(tmp_path, path)
+
+
+def _retry_deferred(deferred, tasks, outputs, work, executor, stats):
+    """
+    Deferred pass: re-runs the texts that failed in the main pass and patches
+    their rows in the written outputs. Rows are only replaced by a complete
+    result. Adjusts stats['errors'] and stats['partial'] and returns the number
+    of texts recovered.
+    """
+    print(f"Retrying {len(deferred)} failed texts...")
+    replacements = [{} for _ in tasks]
+    recovered = 0
+    retried = executor.map(lambda entry: work(entry[0], retry_of=entry[1]), deferred)
+    for (text, retry_of, spans), (results, error_class) in zip(deferred, retried):
+        if error_class:
+            continue
+        recovered += 1
+        stats["partial"] -= int(retry_of == "salvaged")
+        for t, task in enumerate(tasks):
+            if spans[t] is None:
+                continue
+            first, count, was_error = spans[t]
+            result = results[task["name"]]
+            replacements[t][first] = (count, _output_rows(task, text, result))
+            stats["errors"] += int(task["is_error"](result)) - was_error
+    for task, rows in zip(tasks, replacements):
+        if rows:
+            _rewrite_rows(outputs[task["name"]], _output_fieldnames(task), rows)
+    print(f"Deferred pass recovered {recovered}/{len(deferred)} texts.")
+    return recovered
+
+
+def run_tasks(outputs, input_file, limit=None, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+              session=None, cache=None, task_options=None, sizes=None, backend="mmap", report_path=None,
+              progress=None):
+    """
+    Runs registered tasks over the text column of `input_file` with a thread pool.
+    `outputs` maps task name -> output CSV. With several tasks, each text costs a
+    single model call whose response is split into every task's output file.
+    Rows are written in input order, each with an 'error_class' column that is
+    empty for complete results and e.g. 'salvaged' for partial ones. max_tokens comes from `sizes` (observed output
+    sizes per field set; default: kept in memory for this run only). Nothing but
+    the outputs is written unless asked: pass an OutputSizeStats with a path to
+    persist sizes, and report_path=True (next to the first output) or a base path
+    to write a run report (.json/.html).
+    `progress(done, total, stats)` is called every PROGRESS_INTERVAL seconds.
+    Returns a Counter of run statistics, or None if the input could not be read.
+    """
+    if not os.path.exists(input_file):
+        print(f"File {input_file} not found.")
+        return None
+
+    task_options = task_options or {}
+    tasks = [load_task(name, **task_options.get(name, {})) for name in outputs]
+    if len(tasks) == 1:
+        plan = tasks[0]
+    else:
+        # Local short-circuits can't skip a call another task still needs
+        plan = combine_tasks(tasks)
+
+    sizes = sizes if sizes is not None else OutputSizeStats(path=None)
+    if plan.get("size_key"):
+        plan["max_tokens"] = sizes.max_tokens(plan["size_key"], plan["max_tokens"])
+
+    texts = read_texts(input_file, plan["columns"], plan["keep_empty"], limit, backend,
+                       plan.get("require_column", False))
+    if texts is None:
+        return None
+
+    # Hedged duplicates and their losing requests need connections beyond the workers
+    session = session or setup_requests_session(workers * 2)
+    cache = cache if cache is not None else ResponseCache()
+    # Caches may be shared across runs (e.g. job_worker); count this run's hits only
+    hits_before = cache.hits
+    limiter = RateLimiter(rate)
+    usage = UsageStats(sizes)
+    hedge = HedgedRequests(workers)
+    stats = Counter()
+    timeline = Counter()  # elapsed second -> texts completed
+    started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    print(f"Processing {len(texts)} entries from {input_file} with task '{plan['name']}' ({workers} workers)...")
+    started = time.monotonic()
+
+    def work(text, retry_of=None):
+        result = analyze_text(session, plan, text, cache, limiter, usage, hedge, retry_of)
+        error_class = result.get("error_class")
+        if plan is tasks[0]:
+            return {plan["name"]: result}, error_class
+        if "_split" in result:
+            return result["_split"], error_class
+        prepared = plan["prepare"](text)
+        return split_result(plan, prepared or text, result), error_class
+
+    # Failed texts are re-queued here instead of stalling the main pass:
+    # (text, error class, per task: (first output row, row count, error rows))
+    deferred = []
+    rows_written = [0] * len(tasks)
+    last_progress = started
+    files = [open(outputs[task["name"]], 'w', newline='', encoding='utf-8') for task in tasks]
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                writers = []
+                for task, f in zip(tasks, files):
+                    writer = csv.DictWriter(f, fieldnames=_output_fieldnames(task), extrasaction='ignore')
+                    writer.writeheader()
+                    writers.append(writer)
+
+                # The first request runs alone so the server has the shared prefix
+                # cached before the pool fans out; the rest then reuse it.
+                primed = [work(texts[0])] if texts else []
+                all_results = itertools.chain(primed, executor.map(work, texts[1:]))
+                for i, (text, (results, error_class)) in enumerate(zip(texts, all_results)):
+                    print(f"[{i+1}/{len(texts)}] Analyzed")
+                    stats["texts"] += 1
+                    timeline[int(time.monotonic() - started)] += 1
+                    spans = []
+                    for t, (task, writer) in enumerate(zip(tasks, writers)):
+                        if not text and not task["keep_empty"]:
+                            spans.append(None)
+                            continue
+                        result = results[task["name"]]
+                        rows = _output_rows(task, text, result)
+                        writer.writerows(rows)
+                        is_error = int(task["is_error"](result))
+                        spans.append((rows_written[t], len(rows), is_error))
+                        rows_written[t] += len(rows)
+                        stats["errors"] += is_error
+                        if result.get("source"):
+                            stats[f"source_{result['source']}"] += 1
+                        for metric in task.get("metrics", ()):
+                            stats[metric] += result.get(metric, 0) or 0
+                    # Partial results are kept as rows marked 'salvaged' unless the deferred pass completes them
+                    stats["partial"] += int(error_class == "salvaged")
+                    if error_class and retry_policy(error_class)["defer"]:
+                        deferred.append((text, error_class, spans))
+                    if progress and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = time.monotonic()
+                        progress(i + 1, len(texts), stats)
+            finally:
+                for f in files:
+                    f.close()
+
+            if deferred:
+                stats["recovered"] = _retry_deferred(deferred, tasks, outputs, work, executor, stats)
+    finally:
+        hedge.shutdown()
+
+    stats["cache_hits"] = cache.hits - hits_before
+    stats["deferred"] = len(deferred)
+    stats["hedged"] = hedge.hedged
+    stats["hedge_wins"] = hedge.wins
+    stats.update(usage.totals)
+    elapsed = time.monotonic() - started
+    sizes.save()
+    print(f"{stats['texts']} texts in {elapsed:.1f}s ({stats['texts'] / elapsed if elapsed else 0:.1f}/s), "
+          f"{stats['errors']} errors, {stats['partial']} partial results, {stats['cache_hits']} cache hits.")
+    if usage.totals["calls"]:
+        print(f"Model usage: {usage.summary()}, max_tokens {plan['max_tokens']}.")
+    if stats["retries"] or stats["deferred"] or stats["salvaged"] or stats["hedged"]:
+        print(f"Retries: {stats['retries']} inline, {stats['deferred']} texts deferred ({stats['deferred_retries']} "
+              f"further retries, {stats['recovered']} recovered), "
+              f"{stats['salvaged']} salvaged partial results, {stats['hedged']} hedged requests "
+              f"({stats['hedge_wins']} won by the hedge).")
+    for task in tasks:
+        if task.get("report"):
+            task["report"](stats, sizes)
+
+    if report_path:
+        from run_report import latency_summary, throughput_timeline, write_run_report
+
+        calls = usage.totals["calls"] + usage.totals["failed_calls"]
+        lookups = stats["cache_hits"] + calls
+        report = {
+            "run": {
+                "driver": "analysis_engine",
+                "tasks": plan["name"],
+                "input_file": input_file,
+                "outputs": ", ".join(outputs.values()),
+                "started_at": started_at,
+                "elapsed_seconds": round(elapsed, 3),
+                "workers": workers,
+                "rate_limit": rate,
+                "max_tokens": plan["max_tokens"],
+                "endpoint": ", ".join(replicas_for(plan)[:max(1, PREFIX_REPLICAS)]),
+            },
+            "totals": {
+                "texts": stats["texts"],
+                "texts_per_second": round(stats["texts"] / elapsed, 2) if elapsed else 0.0,
+                "calls": calls,
+                "failed_calls": usage.totals["failed_calls"],
+                "cache_hits": stats["cache_hits"],
+                "cache_hit_rate": round(stats["cache_hits"] / lookups, 3) if lookups else 0.0,
+                "local_results": stats["source_local"],
+                "error_rows": stats["errors"],
+                "error_rate": round(stats["errors"] / stats["texts"], 4) if stats["texts"] else 0.0,
+                "prompt_tokens": usage.totals["prompt_tokens"],
+                "cached_prompt_tokens": usage.totals["cached_tokens"],
+                "completion_tokens": usage.totals["completion_tokens"],
+                "total_tokens": usage.totals["prompt_tokens"] + usage.totals["completion_tokens"],
+                "truncated_responses": usage.totals["truncated"],
+                "salvaged_results": usage.totals["salvaged"],
+                "partial_results": stats["partial"],
+                "inline_retries": usage.totals["retries"],
+                "deferred_retries": usage.totals["deferred_retries"],
+                "deferred_texts": stats["deferred"],
+                "recovered_texts": stats["recovered"],
+                "hedged_requests": stats["hedged"],
+                "hedge_wins": stats["hedge_wins"],
+            },
+            "latency_ms": latency_summary(usage.latencies_ms),
+            "throughput": throughput_timeline(timeline),
+            "errors_by_class": dict(usage.errors),
+        }
+        base = report_path if isinstance(report_path, str) else os.path.splitext(next(iter(outputs.values())))[0] + "_run_report"
+        write_run_report(report, base)
+
+    print(f"Done! Results saved to {', '.join(outputs.values())}")
+    return stats
+
+
+def run_task(task_name, input_file, output_file, limit=None, workers=DEFAULT_WORKERS,
+             rate=DEFAULT_RATE, session=None, cache=None, sizes=None, backend="mmap", report_path=None,
+             **options):
+    """Runs a single registered task; see run_tasks()."""
+    return run_tasks({task_name: output_file}, input_file, limit=limit, workers=workers, rate=rate,
+                     session=session, cache=cache, task_options={task_name: options}, sizes=sizes,
+                     backend=backend, report_path=report_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run analysis tasks over a CSV of texts.")
+    parser.add_argument("tasks", help=f"comma-separated tasks, one model call per text ({', '.join(sorted(TASK_MODULES))})")
+    parser.add_argument("input_csv")
+    parser.add_argument("output_csv", nargs="+", help="one output file per task, in the same order")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="max requests/sec (0 = unlimited)")
+    parser.add_argument("--cache", default=None, help="JSON-lines file to persist model results across runs")
+    parser.add_argument("--prefilter", type=float, default=None, help="sentiment-lite: local confidence threshold")
+    parser.add_argument("--local-extraction", action="store_true", help="nlp: extract URLs/tickers locally")
+    parser.add_argument("--fields", default=None, help="nlp: comma-separated fields or preset (e.g. 'kg')")
+    parser.add_argument("--report", default=None, help="run report base path (default: next to the first output)")
+    parser.add_argument("--no-report", action="store_true", help="don't write a run report")
+    parser.add_argument("--reader", choices=BACKENDS, default="mmap", help="CSV ingestion backend")
+    parser.add_argument("--size-stats", default=DEFAULT_SIZE_STATS, help="JSON file of observed output sizes for max_tokens")
+    args = parser.parse_args()
+
+    names = args.tasks.split(",")
+    unknown = [n for n in names if n not in TASK_MODULES]
+    if unknown or len(names) != len(args.output_csv):
+        parser.error(f"need one output per task from {', '.join(sorted(TASK_MODULES))}")
+
+    task_options = {"sentiment-lite": {}, "nlp": {}}
+    if args.prefilter is not None:
+        task_options["sentiment-lite"]["prefilter_threshold"] = args.prefilter
+    if args.local_extraction:
+        task_options["nlp"]["local_extraction"] = True
+    if args.fields:
+        task_options["nlp"]["fields"] = args.fields
+
+    run_tasks(dict(zip(names, args.output_csv)), args.input_csv, limit=args.limit, workers=args.workers,
+              rate=args.rate, cache=ResponseCache(args.cache), task_options=task_options,
+              sizes=OutputSizeStats(args.size_stats), backend=args.reader,
+              report_path=False if args.no_report else (args.report or True))
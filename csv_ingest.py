@@ -0,0 +1,200 @@
+import csv
+import io
+import mmap
+import os
+import re
+import time
+
+# High-throughput CSV ingestion: the file is memory-mapped and cut into chunks on
+# record boundaries (never inside a quoted field, so multi-line Reddit bodies stay
+# intact), each chunk is parsed by the C csv reader and rows are yielded as tuples.
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+BACKENDS = ("mmap", "pyarrow", "auto")
+
+# A run of complete records, quoted the way csv.reader reads them: a quote opens
+# a quoted field only at the start of a field ("" escapes inside it, anything
+# after the closing quote is literal); elsewhere a quote is a literal character.
+_FIELD = rb'(?:"[^"]*(?:""[^"]*)*"(?!")[^,\r\n]*|(?!")[^,\r\n]*)'
+_RECORDS_RE = re.compile(rb'(?:' + _FIELD + rb'(?:,' + _FIELD + rb')*\r?\n)*')
+
+
+def iter_chunks(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Yields decoded text chunks of `path` that each end on a record boundary."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 3 if mm[:3] == b'\xef\xbb\xbf' else 0
+            while pos < size:
+                end = min(pos + chunk_bytes, size)
+                chunk = mm[pos:end]
+                if end < size:
+                    # Chunks start on a record boundary; keep the complete records
+                    cut = _RECORDS_RE.match(chunk).end()
+                    if cut == 0:
+                        # A single record is longer than the chunk; widen and retry
+                        chunk_bytes *= 2
+                        continue
+                    chunk = chunk[:cut]
+                pos += len(chunk)
+                yield chunk.decode('utf-8', errors='replace')
+
+
+def _iter_records(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    for chunk in iter_chunks(path, chunk_bytes):
+        yield from csv.reader(io.StringIO(chunk, newline=''))
+
+
+def iter_rows(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Yields every record of `path` (header included) as a tuple of strings."""
+    return map(tuple, _iter_records(path, chunk_bytes))
+
+
+def read_header(path):
+    """Returns the header row as a tuple, or None for an empty file."""
+    return next(iter_rows(path, chunk_bytes=64 * 1024), None)
+
+
+def _read_column_mmap(path, idx, keep_empty, limit, chunk_bytes):
+    values = []
+    rows = _iter_records(path, chunk_bytes)
+    next(rows, None)
+    for row in rows:
+        value = row[idx] if idx < len(row) else ""
+        if value or keep_empty:
+            values.append(value)
+            if limit and len(values) >= limit:
+                break
+    return values
+
+
+def _read_column_pyarrow(path, col_name, keep_empty, limit):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=DEFAULT_CHUNK_BYTES),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=[col_name],
+            column_types={col_name: pa.string()},
+            strings_can_be_null=False,
+        ),
+    )
+    values = []
+    for batch in reader:
+        for value in batch.column(0).to_pylist():
+            value = value or ""
+            if value or keep_empty:
+                values.append(value)
+                if limit and len(values) >= limit:
+                    return values
+    return values
+
+
+def read_column(path, col_name, keep_empty=False, limit=None, backend="mmap",
+                chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Reads one column of `path` as a list of strings.
+    backend: 'mmap' (stdlib), 'pyarrow' (requires pyarrow) or 'auto' (pyarrow if
+    installed, falling back to mmap on import or decode errors).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Available: {', '.join(BACKENDS)}")
+
+    if backend in ("pyarrow", "auto"):
+        try:
+            return _read_column_pyarrow(path, col_name, keep_empty, limit)
+        except ImportError:
+            if backend == "pyarrow":
+                raise
+        except Exception as e:
+            if backend == "pyarrow":
+                raise
+            print(f"pyarrow reader failed ({e}); falling back to mmap reader.")
+
+    header = read_header(path)
+    return _read_column_mmap(path, header.index(col_name), keep_empty, limit, chunk_bytes)
+
+
+def _count_dictreader(path):
+    """The original reader: text mode with errors='replace' and a dict per row."""
+    n = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for _ in csv.DictReader(f):
+            n += 1
+    return n
+
+
+def _count_mmap(path):
+    return sum(1 for _ in iter_rows(path)) - 1
+
+
+def _count_mmap_column(path):
+    return len(_read_column_mmap(path, 0, True, None, DEFAULT_CHUNK_BYTES))
+
+
+def _count_pyarrow(path):
+    import pyarrow.csv as pacsv
+    reader = pacsv.open_csv(path, parse_options=pacsv.ParseOptions(newlines_in_values=True))
+    return sum(batch.num_rows for batch in reader)
+
+
+def make_benchmark_file(src, dest, target_mb=1024):
+    """Writes `dest` by repeating the data rows of `src` until it reaches target_mb."""
+    with open(src, 'rb') as f:
+        header = f.readline()
+        body = f.read()
+    if not body.endswith(b'\n'):
+        body += b'\n'
+    target = target_mb * 1024 * 1024
+    with open(dest, 'wb') as out:
+        out.write(header)
+        written = len(header)
+        while written < target:
+            out.write(body)
+            written += len(body)
+    return dest
+
+
+def benchmark(path):
+    """Times each available reader on `path` and prints rows/sec."""
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    readers = [
+        ("csv.DictReader (previous)", _count_dictreader),
+        ("mmap chunked, tuple rows", _count_mmap),
+        ("mmap chunked, one column", _count_mmap_column),
+    ]
+    try:
+        import pyarrow.csv  # noqa: F401
+        readers.append(("pyarrow", _count_pyarrow))
+    except ImportError:
+        print("pyarrow not installed; skipping pyarrow backend.")
+
+    print(f"Benchmarking {path} ({size_mb:.0f} MB)")
+    results = {}
+    for name, fn in readers:
+        started = time.perf_counter()
+        rows = fn(path)
+        elapsed = time.perf_counter() - started
+        results[name] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed)}
+        print(f"  {name:<26} {rows:>12,} rows  {elapsed:8.2f}s  {rows / elapsed:>14,.0f} rows/s  {size_mb / elapsed:8.1f} MB/s")
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    # Usage: python csv_ingest.py <csv> [target_mb]
+    #   With target_mb, a benchmark file of that size is built from <csv> first.
+    if len(sys.argv) < 2:
+        print("Usage: python csv_ingest.py <input_csv> [target_mb]")
+        sys.exit(1)
+
+    src = sys.argv[1]
+    if len(sys.argv) > 2:
+        path = make_benchmark_file(src, "benchmark_input.csv", int(sys.argv[2]))
+    else:
+        path = src
+    benchmark(path)
@@ -1,5 +1,6 @@
 import csv
 import random
+from collections import deque
 
 instruments = [
     "Equity", "ETF", "FX", "Options", "Futures", "Swap", "Bonds", 
@@ -123,5 +124,181 @@ def generate_data(num_points=100):
     
     print(f"Generated {num_points} data points in {output_file}")
 
+# Extra vocabulary for scaled-up generation
+ENTITY_CLAUSES = [
+    "NVDA and MSFT are leading the move.",
+    "EUR/USD and GBP/JPY both gapped overnight.",
+    "Watching $TSLA, $AAPL and SPY into the close.",
+    "Jerome Powell said the Federal Reserve will stay patient.",
+    "Goldman Sachs and JPMorgan raised their targets.",
+    "Elon Musk tweeted about Dogecoin again.",
+    "See https://www.reuters.com/markets/ for the full story.",
+    "Chart here: https://tradingview.com/x/abc123/",
+    "VOO, VTI and QQQ all closed green.",
+    "The ECB and the Bank of Japan diverged on rates.",
+]
+
+FILLER_SENTENCES = [
+    "Not financial advice.",
+    "Just my two cents.",
+    "Curious what everyone else thinks.",
+    "This has been the pattern for months.",
+    "Volume was light today.",
+    "I could be wrong though.",
+]
+
+# Same kinds of inputs as edge_case_test.csv
+EDGE_CASES = [
+    "",
+    "    ",
+    "💩",
+    "A",
+    "This is great! 🚀🚀🚀",
+    "https://example.com/very-long-url-that-might-confuse-it",
+    "I HATE EVERYTHING AND THIS IS THE WORST THING EVER",
+    "Line one of a Reddit post.\n\nLine two, with \"quotes\" and a, comma.\n- bullet",
+    "Ünïcödé ñames: Société Générale, Zürich, 東京",
+    "word " * 1000,
+]
+
+LENGTH_MEAN_SENTENCES = {"short": 1.0, "medium": 2.5, "long": 6.0}
+
+
+def generate_stream(output_file, num_rows, seed=None, duplicate_ratio=0.0, length="short",
+                    entity_density=0.0, edge_case_ratio=0.0, batch_size=10000):
+    """
+    Streams `num_rows` synthetic comments to `output_file` in batches (constant memory).
+    - duplicate_ratio: probability a row repeats an earlier one (exercises caches);
+      all other non-edge-case rows are unique
+    - length: 'short' | 'medium' | 'long' mean sentence count (geometric distribution)
+    - entity_density: probability a row gets a ticker/FX/URL/person clause
+    - edge_case_ratio: probability a row is an edge case like edge_case_test.csv
+      (drawn from a fixed set, so these may repeat)
+    The same seed always produces the same file.
+    """
+    rng = random.Random(seed)
+    pairs = [(i, c) for i in instruments for c in comments[i]]
+    # Geometric extra-sentence count with the requested mean
+    p_more = 1.0 - 1.0 / LENGTH_MEAN_SENTENCES[length]
+    recent = deque(maxlen=10000)
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Financial Instrument", "Body"])
+
+        written = 0
+        while written < num_rows:
+            batch = []
+            for _ in range(min(batch_size, num_rows - written)):
+                r = rng.random()
+                row = None
+                if r < duplicate_ratio:
+                    # Nothing to repeat yet: the row is a fresh one instead
+                    if recent:
+                        row = recent[rng.randrange(len(recent))]
+                elif r < duplicate_ratio + edge_case_ratio:
+                    row = (rng.choice(instruments), rng.choice(EDGE_CASES))
+                if row is None:
+                    instrument, body = rng.choice(pairs)
+                    parts = [body]
+                    while rng.random() < p_more:
+                        parts.append(rng.choice(FILLER_SENTENCES) if rng.random() < 0.5 else rng.choice(pairs)[1])
+                    if rng.random() < entity_density:
+                        parts.insert(rng.randrange(len(parts) + 1), rng.choice(ENTITY_CLAUSES))
+                    # Suffix keeps fresh rows unique, so only duplicate_ratio rows repeat
+                    row = (instrument, f"{' '.join(parts)} #{written + len(batch)}")
+                    recent.append(row)
+                batch.append(row)
+            writer.writerows(batch)
+            written += len(batch)
+
+    print(f"Generated {num_rows} data points in {output_file}")
+
+
+# Entities used for fake analysis results: (text, canonical name, label)
+FAKE_ENTITIES = [
+    ("NVDA", "NVIDIA Corporation", "Organization"),
+    ("MSFT", "Microsoft Corporation", "Organization"),
+    ("Apple", "Apple Inc.", "Organization"),
+    ("Tesla", "Tesla Inc.", "Organization"),
+    ("the Fed", "Federal Reserve", "Organization"),
+    ("ECB", "European Central Bank", "Organization"),
+    ("Goldman", "Goldman Sachs", "Organization"),
+    ("Powell", "Jerome Powell", "Person"),
+    ("Musk", "Elon Musk", "Person"),
+    ("Brazil", "Brazil", "Location"),
+    ("China", "People's Republic of China", "Location"),
+    ("US", "United States of America", "Location"),
+    ("EUR/USD", "EUR/USD", "Financial"),
+    ("Bitcoin", "Bitcoin", "Financial"),
+    ("S&P 500", "S&P 500", "Financial"),
+] + [(i, i, "Financial") for i in instruments]
+
+
+def generate_fake_results(output_file, num_texts, seed=None, max_entities=4, input_file=None):
+    """
+    Writes an nlp_processor-style results CSV (one row per entity) without calling
+    the LLM, so knowledge_graph_extractor can be benchmarked in isolation.
+    Texts come from `input_file` if given, otherwise from the canned comments.
+    """
+    from nlp_processor import FIELDNAMES
+
+    rng = random.Random(seed)
+    sentiments = ["positive", "negative", "neutral"]
+
+    def probs():
+        a, b = sorted((rng.random(), rng.random()))
+        return round(a, 3), round(b - a, 3), round(1 - b, 3)
+
+    texts = []
+    if input_file:
+        from analysis_engine import read_texts
+        texts = read_texts(input_file) or []
+        if not texts:
+            print(f"No texts found in {input_file}; using the canned comments.")
+    if not texts:
+        texts = [c for i in instruments for c in comments[i]]
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDNAMES)
+        for n in range(num_texts):
+            # Suffix keeps texts unique so the extractor sees num_texts documents
+            text = f"{texts[n % len(texts)]} #{n}"
+            sent = rng.choice(sentiments)
+            pos, neg, neu = probs()
+            base = [text, sent, pos, neg, neu, "Synthetic summary.", "Synthetic rewording.", "markets", ""]
+            chosen = rng.sample(FAKE_ENTITIES, rng.randint(0, max_entities))
+            if not chosen:
+                writer.writerow(base + ["N/A", "N/A", "N/A", "N/A", 0.0, 0.0, 0.0, 0.0])
+            for e_text, canon, label in chosen:
+                e_pos, e_neg, e_neu = probs()
+                writer.writerow(base + [e_text, canon, label, rng.choice(sentiments), e_pos, e_neg, e_neu,
+                                        round(rng.uniform(0.5, 1.0), 3)])
+
+    print(f"Generated fake analysis results for {num_texts} texts in {output_file}")
+
+
 if __name__ == "__main__":
-    generate_data(100)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic comments (default: 100 rows to financial_instrument_comments.csv).")
+    parser.add_argument("--rows", type=int, default=None, help="stream this many rows instead of the 100-row sample")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--length", choices=sorted(LENGTH_MEAN_SENTENCES), default="short")
+    parser.add_argument("--entity-density", type=float, default=0.0)
+    parser.add_argument("--edge-case-ratio", type=float, default=0.0)
+    parser.add_argument("--fake-results", type=int, default=None, metavar="N",
+                        help="write fake nlp results for N texts (for knowledge_graph_extractor)")
+    args = parser.parse_args()
+
+    if args.fake_results is not None:
+        generate_fake_results(args.output or "fake_nlp_results.csv", args.fake_results, seed=args.seed)
+    elif args.rows is not None:
+        generate_stream(args.output or "synthetic_comments.csv", args.rows, seed=args.seed,
+                        duplicate_ratio=args.duplicate_ratio, length=args.length,
+                        entity_density=args.entity_density, edge_case_ratio=args.edge_case_ratio)
+    else:
+        generate_data(100)
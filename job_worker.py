@@ -0,0 +1,278 @@
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import time
+import uuid
+
+from analysis_engine import (
+    DEFAULT_RATE,
+    DEFAULT_WORKERS,
+    OutputSizeStats,
+    ResponseCache,
+    run_tasks,
+    setup_requests_session,
+)
+
+# Long-running worker: consumes CSV drops from an inbox directory and/or a
+# SQLite-backed queue, keeping the HTTP session, result cache and output-size
+# stats warm across jobs instead of paying process startup per hourly file.
+DEFAULT_DB = "job_queue.sqlite3"
+DEFAULT_TASKS = ["sentiment-lite"]
+POLL_INTERVAL = 5.0
+# In-memory result cache bound for a long-lived worker (least recently used evicted)
+DEFAULT_CACHE_ENTRIES = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_file TEXT NOT NULL,
+    outputs TEXT NOT NULL,
+    task_options TEXT NOT NULL DEFAULT '{}',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    texts INTEGER,
+    errors INTEGER,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+"""
+
+
+class JobQueue:
+    """Priority job queue in SQLite. Higher priority first, then FIFO."""
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def submit(self, input_file, outputs, priority=0, task_options=None):
+        """Queues `input_file` for the tasks in `outputs` ({task: output_csv}). Returns the job id."""
+        cur = self.conn.execute(
+            "INSERT INTO jobs (input_file, outputs, task_options, priority, submitted_at) VALUES (?, ?, ?, ?, ?)",
+            (input_file, json.dumps(outputs), json.dumps(task_options or {}), priority, time.time()),
+        )
+        return cur.lastrowid
+
+    def claim_next(self):
+        """Atomically marks the next queued job as running and returns it (or None)."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row:
+                self.conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                                  (time.time(), row["id"]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row else None
+
+    def finish(self, job_id, stats):
+        self.conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, texts = ?, errors = ? WHERE id = ?",
+            (time.time(), stats.get("texts", 0), stats.get("errors", 0), job_id),
+        )
+
+    def fail(self, job_id, message):
+        self.conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, message = ? WHERE id = ?",
+                          (time.time(), message, job_id))
+
+    def requeue_running(self):
+        """Returns jobs left 'running' by a crashed worker to the queue."""
+        return self.conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
+
+    def counts(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def recent(self, limit=20):
+        rows = self.conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+
+def output_paths(input_file, tasks, output_dir):
+    """<output_dir>/<input stem>.<task>.csv for each task."""
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    return {task: os.path.abspath(os.path.join(output_dir, f"{stem}.{task}.csv")) for task in tasks}
+
+
+# Inbox path -> size at the previous scan
+_inbox_sizes = {}
+
+
+def scan_inbox(inbox, queue, tasks, output_dir, priority=0, task_options=None):
+    """
+    Queues CSVs that have appeared in `inbox`. A file is taken once its size is
+    unchanged since the previous scan (i.e. the writer has finished); it is moved
+    to inbox/claimed/ under a unique name so it is queued exactly once, and its
+    outputs are named after the claimed file. Returns the new job ids.
+    """
+    claimed_dir = os.path.join(inbox, "claimed")
+    os.makedirs(claimed_dir, exist_ok=True)
+    job_ids = []
+    for name in sorted(os.listdir(inbox)):
+        path = os.path.join(inbox, name)
+        if not name.lower().endswith(".csv") or not os.path.isfile(path):
+            continue
+        size = os.path.getsize(path)
+        if _inbox_sizes.get(path) != size:
+            _inbox_sizes[path] = size
+            continue
+        del _inbox_sizes[path]
+        # Unique claimed name, so repeated drops of the same file name keep their
+        # own input and (via output_paths) their own results
+        target = os.path.abspath(os.path.join(claimed_dir, f"{int(time.time())}_{uuid.uuid4().hex[:8]}_{name}"))
+        shutil.move(path, target)
+        job_ids.append(queue.submit(target, output_paths(target, tasks, output_dir), priority, task_options))
+        print(f"Queued {name} (priority {priority})")
+    return job_ids
+
+
+def run_worker(db_path=DEFAULT_DB, inbox=None, output_dir="results", tasks=DEFAULT_TASKS,
+               task_options=None, priority=0, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+               cache_path=None, cache_entries=DEFAULT_CACHE_ENTRIES, stats_file="worker_stats.json",
+               poll_interval=POLL_INTERVAL, once=False):
+    """
+    Runs until SIGINT/SIGTERM (or, with once=True, until the queue is drained).
+    The session, cache and size stats are created once and shared by every job.
+    Progress and throughput are written to `stats_file` during and after each job.
+    """
+    queue = JobQueue(db_path)
+    recovered = queue.requeue_running()
+    if recovered:
+        print(f"Re-queued {recovered} interrupted job(s).")
+    os.makedirs(output_dir, exist_ok=True)
+
+    session = setup_requests_session(workers * 2)
+    cache = ResponseCache(cache_path, max_entries=cache_entries)
+    sizes = OutputSizeStats()
+
+    stopping = []
+    def request_stop(signum, frame):
+        print("Stopping after the current job...")
+        stopping.append(signum)
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    started = time.time()
+    totals = {"jobs_done": 0, "jobs_failed": 0, "texts": 0, "errors": 0, "cache_hits": 0, "busy_seconds": 0.0}
+
+    def write_stats(current=None, progress=None):
+        uptime = time.time() - started
+        snapshot = dict(totals)
+        snapshot.update({
+            "uptime_seconds": round(uptime, 1),
+            "texts_per_second": round(totals["texts"] / totals["busy_seconds"], 2) if totals["busy_seconds"] else 0.0,
+            "queue": queue.counts(),
+            "current_job": current,
+            "current_job_progress": progress,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        with open(stats_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2)
+
+    print(f"Worker started (db={db_path}, inbox={inbox or '-'}, tasks={','.join(tasks)})")
+    write_stats()
+    while not stopping:
+        if inbox:
+            scan_inbox(inbox, queue, tasks, output_dir, priority, task_options)
+
+        job = queue.claim_next()
+        if job is None:
+            if once and not (inbox and any(n.lower().endswith(".csv") for n in os.listdir(inbox))):
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"Job {job['id']}: {job['input_file']}")
+        write_stats(current=job["id"])
+        job_started = time.time()
+
+        def job_progress(done, total, stats, job_id=job["id"]):
+            elapsed = time.time() - job_started
+            write_stats(current=job_id, progress={
+                "texts_done": done,
+                "texts_total": total,
+                "errors": stats["errors"],
+                "texts_per_second": round(done / elapsed, 2) if elapsed else 0.0,
+            })
+
+        try:
+            stats = run_tasks(json.loads(job["outputs"]), job["input_file"], workers=workers, rate=rate,
+                              session=session, cache=cache, sizes=sizes,
+                              task_options=json.loads(job["task_options"]), progress=job_progress,
+                              report_path=True)
+            if stats is None:
+                raise RuntimeError("input could not be read")
+        except Exception as e:
+            queue.fail(job["id"], str(e))
+            totals["jobs_failed"] += 1
+            print(f"Job {job['id']} failed: {e}")
+        else:
+            queue.finish(job["id"], stats)
+            totals["jobs_done"] += 1
+            totals["texts"] += stats["texts"]
+            totals["errors"] += stats["errors"]
+            totals["cache_hits"] += stats["cache_hits"]
+        totals["busy_seconds"] = round(totals["busy_seconds"] + time.time() - job_started, 3)
+        write_stats()
+
+    write_stats()
+    print(f"Worker stopped: {totals['jobs_done']} jobs done, {totals['jobs_failed']} failed, {totals['texts']} texts.")
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Queue-backed analysis worker.")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="start the worker")
+    p_run.add_argument("--inbox", default=None, help="directory to watch for new CSV files")
+    p_run.add_argument("--output-dir", default="results")
+    p_run.add_argument("--tasks", default=",".join(DEFAULT_TASKS), help="tasks for inbox files (comma-separated)")
+    p_run.add_argument("--priority", type=int, default=0, help="priority for inbox files")
+    p_run.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    p_run.add_argument("--rate", type=float, default=DEFAULT_RATE)
+    p_run.add_argument("--cache", default=None, help="JSON-lines file to persist model results")
+    p_run.add_argument("--cache-entries", type=int, default=DEFAULT_CACHE_ENTRIES,
+                       help="max results kept in memory (0 = unbounded)")
+    p_run.add_argument("--stats-file", default="worker_stats.json")
+    p_run.add_argument("--poll", type=float, default=POLL_INTERVAL)
+    p_run.add_argument("--once", action="store_true", help="exit when there is no more work")
+
+    p_submit = sub.add_parser("submit", help="queue a CSV file")
+    p_submit.add_argument("input_csv")
+    p_submit.add_argument("--tasks", default=",".join(DEFAULT_TASKS))
+    p_submit.add_argument("--output-dir", default="results")
+    p_submit.add_argument("--priority", type=int, default=0)
+
+    sub.add_parser("status", help="show queue counts and recent jobs")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_worker(args.db, args.inbox, args.output_dir, args.tasks.split(","), priority=args.priority,
+                   workers=args.workers, rate=args.rate, cache_path=args.cache,
+                   cache_entries=args.cache_entries or None, stats_file=args.stats_file,
+                   poll_interval=args.poll, once=args.once)
+    elif args.command == "submit":
+        tasks = args.tasks.split(",")
+        job_id = JobQueue(args.db).submit(os.path.abspath(args.input_csv),
+                                          output_paths(args.input_csv, tasks, args.output_dir), args.priority)
+        print(f"Queued job {job_id}")
+    else:
+        queue = JobQueue(args.db)
+        print(json.dumps(queue.counts()))
+        for job in queue.recent():
+            print(f"{job['id']:>5}  {job['status']:<8} p{job['priority']:<3} {job['texts'] or '-':>6} texts  {job['input_file']}")
@@ -4,15 +4,20 @@ import os
 import time
 from itertools import combinations
 
-def process_knowledge_graph_from_csv(input_file, output_file, limit=None):
+def process_knowledge_graph_from_csv(input_file, output_file, limit=None, report_path=None):
     """
     Extract knowledge graph directly from the entities already found in the CSV.
     Creates relationships based on co-occurrence in the same text.
+    With report_path=True (next to the output) or a base path, a run report is
+    written to <base>.json/.html.
     """
     if not os.path.exists(input_file):
         print(f"File {input_file} not found.")
         return
     
+    started = time.monotonic()
+    started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+
     # Data structures
     # Map 'Original_Text' -> list of entity objects
     text_to_entities = {}
@@ -23,7 +28,9 @@ def process_knowledge_graph_from_csv(input_file, output_file, limit=None):
         reader = csv.DictReader(f)
         
         row_count = 0
+        rows_read = 0
         for row in reader:
+            rows_read += 1
             text = row.get("Original_Text", "").strip()
             if not text:
                 continue
@@ -115,6 +122,32 @@ def process_knowledge_graph_from_csv(input_file, output_file, limit=None):
             "edge_count": len(edges)
         }
     }
+
+    if report_path:
+        from run_report import write_run_report
+
+        elapsed = time.monotonic() - started
+        base = report_path if isinstance(report_path, str) else os.path.splitext(output_file)[0] + "_run_report"
+        write_run_report({
+            "run": {
+                "driver": "knowledge_graph_extractor",
+                "input_file": input_file,
+                "outputs": output_file,
+                "started_at": started_at,
+                "elapsed_seconds": round(elapsed, 3),
+            },
+            "totals": {
+                "rows_read": rows_read,
+                "rows_per_second": round(rows_read / elapsed, 1) if elapsed else 0.0,
+                "entity_rows": row_count,
+                "texts": len(unique_texts),
+                "nodes": len(output_nodes),
+                "edges": len(edges),
+            },
+        }, base)
+        # Let the visualizer link to the run summary (path relative to the graph JSON)
+        kg_data["metadata"]["run_report"] = os.path.relpath(
+            base + ".html", os.path.dirname(os.path.abspath(output_file))).replace(os.sep, "/")
     
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(kg_data, f, indent=2)
@@ -130,4 +163,5 @@ if __name__ == "__main__":
         print("Usage: python knowledge_graph_extractor.py <input_csv> <output_json> [limit]")
         sys.exit(1)
         
-    process_knowledge_graph_from_csv(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
+    process_knowledge_graph_from_csv(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None,
+                                     report_path=True)
@@ -1,4 +1,5 @@
 import json
+import os
 import sys
 from collections import defaultdict
 
@@ -77,6 +78,14 @@ def generate_html_visualization(json_file, output_html):
     # Only include unique nodes
     unique_nodes = list({v['id']:v for v in nodes}.values())
 
+    # Link the run summary written next to the graph JSON, if any
+    report_link = ""
+    if metadata.get("run_report"):
+        # Stored relative to the graph JSON; the link must be relative to the HTML
+        report_file = os.path.join(os.path.dirname(os.path.abspath(json_file)), metadata["run_report"])
+        href = os.path.relpath(report_file, os.path.dirname(os.path.abspath(output_html))).replace(os.sep, "/")
+        report_link = f'<br><a href="{href}">Run report</a>'
+
     # Generate HTML
     html_content = f"""<!DOCTYPE html>
 <html lang="en">
@@ -99,7 +108,7 @@ def generate_html_visualization(json_file, output_html):
         <div class="stats">
             Nodes: {len(unique_nodes)}<br>
             Edges: {len(edges)}<br>
-            Source: {metadata.get('source_file', 'Unknown')}
+            Source: {metadata.get('source_file', 'Unknown')}{report_link}
         </div>
         <div style="margin-top:10px; font-size:0.8rem;">
             <span style="color:#FF6B6B">● Person</span> 
@@ -0,0 +1,134 @@
+import json
+import re
+
+from generate_test_data import instruments
+
+# Precompiled local extraction for the items a regex or dictionary handles
+# reliably. Results are merged into the LLM output so the prompt can skip them.
+
+URL_RE = re.compile(r"https?://[^\s<>\"')\]]+|www\.[^\s<>\"')\]]+", re.IGNORECASE)
+
+CURRENCIES = {
+    "USD", "EUR", "GBP", "JPY", "CHF", "CAD", "AUD", "NZD", "CNY", "CNH",
+    "HKD", "SGD", "INR", "SEK", "NOK", "DKK", "MXN", "ZAR", "BRL", "KRW",
+    "BTC", "ETH",
+}
+CURRENCY_PAIR_RE = re.compile(r"\b([A-Z]{3})\s?/\s?([A-Z]{3})\b")
+
+# Tickers seen in our feeds, mapped to canonical names.
+TICKERS = {
+    "AAPL": "Apple Inc.",
+    "AMC": "AMC Entertainment Holdings",
+    "AMZN": "Amazon.com Inc.",
+    "DXY": "U.S. Dollar Index",
+    "GOOG": "Alphabet Inc.",
+    "GOOGL": "Alphabet Inc.",
+    "META": "Meta Platforms Inc.",
+    "MSFT": "Microsoft Corporation",
+    "NVDA": "NVIDIA Corporation",
+    "QQQ": "Invesco QQQ Trust",
+    "SCHD": "Schwab U.S. Dividend Equity ETF",
+    "SPY": "SPDR S&P 500 ETF Trust",
+    "TSLA": "Tesla Inc.",
+    "VIX": "CBOE Volatility Index",
+    "VOO": "Vanguard S&P 500 ETF",
+    "VTI": "Vanguard Total Stock Market ETF",
+}
+# Known tickers match bare; anything else only as a $CASHTAG.
+TICKER_RE = re.compile(r"\$([A-Z]{1,5})\b|\b(" + "|".join(sorted(TICKERS, key=len, reverse=True)) + r")\b")
+
+# Case-sensitive, as spelled in the vocabulary (plus a plural), so everyday
+# words ("no options left", "swap meet", "CDs") don't become entities.
+INSTRUMENT_RE = re.compile(
+    r"\b(" + "|".join(re.escape(i) for i in sorted(instruments, key=len, reverse=True)) + r")(?:s|es)?\b"
+)
+
+LOCAL_LABEL = "Financial"
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for budgeting."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _entity(text, canonical):
+    # A regex match says nothing about sentiment; merge_local_results() fills it in
+    return {
+        "text": text,
+        "label": LOCAL_LABEL,
+        "canonical_name": canonical,
+        "source": "local",
+    }
+
+
+def extract_local(text):
+    """
+    Extracts URLs, tickers, currency pairs and instrument names from `text`.
+    Returns {"urls": [...], "entities": [...]} with entities in the LLM schema.
+    """
+    if not text:
+        return {"urls": [], "entities": []}
+
+    urls = []
+    for m in URL_RE.finditer(text):
+        url = m.group(0).rstrip(".,;:!?")
+        if url not in urls:
+            urls.append(url)
+
+    # Drop URLs before matching tokens so path segments don't become entities
+    scrubbed = URL_RE.sub(" ", text)
+
+    entities = {}
+    for m in CURRENCY_PAIR_RE.finditer(scrubbed):
+        base, quote = m.group(1), m.group(2)
+        if base in CURRENCIES and quote in CURRENCIES:
+            pair = f"{base}/{quote}"
+            entities.setdefault(pair, _entity(m.group(0), pair))
+
+    for m in TICKER_RE.finditer(scrubbed):
+        symbol = m.group(1) or m.group(2)
+        if symbol in CURRENCIES:
+            continue
+        entities.setdefault(symbol, _entity(m.group(0), TICKERS.get(symbol, symbol)))
+
+    for m in INSTRUMENT_RE.finditer(scrubbed):
+        canon = m.group(1)
+        entities.setdefault(canon, _entity(m.group(0), canon))
+
+    return {"urls": urls, "entities": list(entities.values())}
+
+
+def merge_local_results(result, local):
+    """
+    Merges local extraction into a parsed LLM result in place.
+    LLM entities win on conflicts (they carry contextual sentiment). Local entities
+    take the text's overall sentiment and probabilities, since the model is told to
+    leave them out; they have no confidence of their own.
+    Returns the estimated output tokens of the merged items, i.e. what the model
+    did not have to generate; items the model returned anyway don't count.
+    """
+    saved = 0
+    urls = list(result.get("urls") or [])
+    for url in local["urls"]:
+        if url not in urls:
+            urls.append(url)
+            saved += estimate_tokens(json.dumps(url))
+    result["urls"] = urls
+
+    entities = list(result.get("entities") or [])
+    seen = set()
+    for e in entities:
+        seen.add(str(e.get("text", "")).lower())
+        seen.add(str(e.get("canonical_name", "")).lower())
+    for e in local["entities"]:
+        if e["text"].lower() in seen or e["canonical_name"].lower() in seen:
+            continue
+        e = dict(e)
+        for key in ("sentiment", "probabilities"):
+            if key in result:
+                e[key] = json.loads(json.dumps(result[key]))
+        entities.append(e)
+        schema_only = {k: v for k, v in e.items() if k != "source"}
+        saved += estimate_tokens(json.dumps(schema_only))
+    result["entities"] = entities
+    return saved
@@ -1,155 +1,136 @@
-import csv
-import json
-import requests
-import time
-import os
-import urllib3
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from analysis_engine import (
+    DEFAULT_WORKERS,
+    OutputSizeStats,
+    analyze_text,
+    extract_json,
+    run_task,
+    setup_requests_session,
+)
 
 # Configuration
-API_URL = "https://llama3-inference.uat.glacio.intcx.net/v1/chat/completions"
 SYSTEM_PROMPT = "You are a sentiment analysis expert. Analyze the sentiment and return ONLY a JSON object with format: {\"sentiment\": \"positive/negative/neutral\", \"score\": 0.0-1.0, \"reason\": \"brief explanation\"}"
 
-# Disable insecure request warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-def setup_requests_session():
-    """Sets up a requests session with retries for better resilience."""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
-
 def clean_comment(comment):
     """Handles basic cleaning and edge cases for input text."""
     if not comment or not isinstance(comment, str):
         return ""
-    
+
     cleaned = comment.strip()
-    
+
     # Truncate extremely long comments to avoid token limit issues (approx 4k chars)
     if len(cleaned) > 4000:
         cleaned = cleaned[:4000] + "..."
-        
+
     return cleaned
 
-def extract_json(text):
-    """Robustly extracts JSON from potentially conversational model output."""
-    try:
-        # Find the first '{' and last '}'
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        if start != -1 and end != 0:
-            json_str = text[start:end]
-            # Remove potential markdown formatting inside the matches
-            json_str = json_str.replace("```json", "").replace("```", "").strip()
-            return json.loads(json_str)
-        return None
-    except Exception:
-        return None
+def error_result(reason):
+    return {"sentiment": "error", "score": 0.0, "reason": reason}
 
-def analyze_sentiment(session, comment):
-    """Sends a single comment to the API with error handling."""
-    comment = clean_comment(comment)
-    
-    if not comment:
-        return {"sentiment": "skipped", "score": 0.0, "reason": "Empty or invalid comment content"}
-
-    payload = {
-        "model": "llama3",
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": f"Analyze: \"{comment}\""}
-        ],
+def flatten_result(comment, sentiment):
+    """One output row per comment."""
+    return [{
+        "original_comment": comment,
+        "sentiment": sentiment.get("sentiment"),
+        "score": sentiment.get("score"),
+        "reason": sentiment.get("reason"),
+        "source": sentiment.get("source")
+    }]
+
+def build_task(prefilter_threshold=None):
+    """
+    Task definition for the 'sentiment-lite' analysis.
+    If prefilter_threshold is set, confident local lexicon scores skip the LLM call.
+    """
+    task = {
+        "name": "sentiment-lite",
+        "system_prompt": SYSTEM_PROMPT,
+        "user_template": "Analyze: \"{text}\"",
         "temperature": 0.1,
-        "max_tokens": 200
+        "max_tokens": 200,
+        "size_key": "sentiment-lite",
+        "timeout": 45,
+        "columns": ['comments', 'body'],
+        # Other columns (ids, dates) are never analyzed in their place
+        "require_column": True,
+        "keep_empty": True,
+        "prepare": clean_comment,
+        "skip_result": lambda text: {"sentiment": "skipped", "score": 0.0, "reason": "Empty or invalid comment content"},
+        "parse": extract_json,
+        "error_result": error_result,
+        "is_error": lambda result: result.get("sentiment") == "error",
+        "flatten": flatten_result,
+        "fieldnames": ["original_comment", "sentiment", "score", "reason"],
+        # Top-level keys read from the model output; hints describe them when
+        # they are merged into another task's prompt (single-pass mode)
+        "keys": ["sentiment", "score", "reason"],
+        "key_hints": {
+            "sentiment": "\"positive/negative/neutral\"",
+            "score": "0.0-1.0 (strength of the overall sentiment)",
+            "reason": "\"brief explanation of the overall sentiment\"",
+        },
     }
-    
-    try:
-        response = session.post(API_URL, json=payload, verify=False, timeout=45)
-        response.raise_for_status()
-        
-        data = response.json()
-        content = data['choices'][0]['message']['content']
-        
-        result = extract_json(content)
-        if result:
+
+    if prefilter_threshold is not None:
+        from sentiment_prefilter import resolve_locally
+
+        def local_first(comment):
+            return resolve_locally(comment, prefilter_threshold)
+
+        def mark_llm(comment, result):
+            result["source"] = "llm"
             return result
-        else:
-            return {
-                "sentiment": "error", 
-                "score": 0.0, 
-                "reason": f"Failed to parse JSON from model output: {content[:100]}..."
-            }
-            
-    except requests.exceptions.RequestException as e:
-        return {"sentiment": "error", "score": 0.0, "reason": f"API Request failed: {str(e)}"}
-    except Exception as e:
-        return {"sentiment": "error", "score": 0.0, "reason": f"Unexpected error: {str(e)}"}
-
-def process_csv(input_file, output_file, limit=None):
-    """Processes the CSV file and saves results."""
-    if not os.path.exists(input_file):
-        print(f"File {input_file} not found.")
-        return
-
-    session = setup_requests_session()
-    
-    comments_to_process = []
-    try:
-        with open(input_file, 'r', encoding='utf-8', errors='replace') as f:
-            # Handle both comma and semicolon if needed, but stick to standard CSV initially
-            reader = csv.DictReader(f)
-            # Find the comment column (case-insensitive check)
-            col_name = next((c for c in reader.fieldnames if c.lower() == 'comments'), None)
-            
-            if not col_name:
-                print(f"Error: Could not find 'Comments' column in {input_file}. Available: {reader.fieldnames}")
-                return
-
-            for row in reader:
-                comments_to_process.append(row[col_name])
-    except Exception as e:
-        print(f"Error reading CSV: {e}")
-        return
-
-    if limit:
-        comments_to_process = comments_to_process[:limit]
-
-    print(f"Processing {len(comments_to_process)} comments from {input_file}...")
-    
-    results = []
-    for i, comment in enumerate(comments_to_process):
-        print(f"[{i+1}/{len(comments_to_process)}] Analyzing...")
-        sentiment = analyze_sentiment(session, comment)
-        
-        results.append({
-            "original_comment": comment,
-            "sentiment": sentiment.get("sentiment"),
-            "score": sentiment.get("score"),
-            "reason": sentiment.get("reason")
-        })
-        time.sleep(0.1)  # Minimal delay
-
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ["original_comment", "sentiment", "score", "reason"]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
-
-    print(f"Done! Results saved to {output_file}")
+
+        def report(stats, sizes=None):
+            print(f"Local pre-classifier resolved {stats['source_local']}/{stats['texts']} comments; "
+                  f"{stats['source_llm']} sent to the LLM.")
+
+        task["local_first"] = local_first
+        task["postprocess"] = mark_llm
+        task["report"] = report
+        task["fieldnames"] = task["fieldnames"] + ["source"]
+
+    return task
+
+_TASK = None
+
+def analyze_sentiment(session, comment):
+    """Sends a single comment to the API with error handling."""
+    global _TASK
+    if _TASK is None:
+        _TASK = build_task()
+    return analyze_text(session, _TASK, comment)
+
+def process_csv(input_file, output_file, limit=None, prefilter_threshold=None, workers=None,
+                sizes=None, report_path=None):
+    """
+    Processes the CSV file and saves results.
+    If prefilter_threshold is set, confident local lexicon scores skip the LLM call.
+    `sizes` and `report_path` are passed to run_tasks (both off by default).
+    """
+    options = {"prefilter_threshold": prefilter_threshold} if prefilter_threshold is not None else {}
+    return run_task("sentiment-lite", input_file, output_file, limit=limit,
+                    workers=workers or DEFAULT_WORKERS, sizes=sizes, report_path=report_path, **options)
 
 if __name__ == "__main__":
     # Standard run behavior
     import sys
-    if len(sys.argv) > 1 and sys.argv[1] == "--test":
-        process_csv("edge_case_test.csv", "edge_case_results.csv")
+    # Optional: --prefilter [threshold] answers confident comments locally
+    threshold = None
+    if "--prefilter" in sys.argv:
+        from sentiment_prefilter import DEFAULT_THRESHOLD
+        idx = sys.argv.index("--prefilter")
+        threshold = DEFAULT_THRESHOLD
+        if len(sys.argv) > idx + 1:
+            try:
+                threshold = float(sys.argv[idx + 1])
+            except ValueError:
+                pass  # next argument is another flag, e.g. --test
+
+    # The command line persists output sizes and writes a run report next to the output
+    cli = {"sizes": OutputSizeStats(), "report_path": True}
+    if "--test" in sys.argv:
+        process_csv("edge_case_test.csv", "edge_case_results.csv", prefilter_threshold=threshold, **cli)
+    elif "--instruments" in sys.argv:
+        process_csv("financial_instrument_comments.csv", "instrument_sentiment_results.csv", prefilter_threshold=threshold, **cli)
     else:
-        process_csv("AICOE_api_endpoint.csv", "sentiment_results.csv", limit=5)
+        process_csv("AICOE_api_endpoint.csv", "sentiment_results.csv", limit=5, prefilter_threshold=threshold, **cli)
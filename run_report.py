@@ -0,0 +1,150 @@
+import html
+import json
+import time
+
+# Machine-readable run report (JSON) plus a static HTML summary for capacity
+# planning: tokens, calls, cache hits, error classes, latency and throughput.
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+MAX_TIMELINE_POINTS = 120
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100.0))]
+
+
+def latency_summary(latencies_ms):
+    """p50/p90/p99/max/mean plus a histogram of counts per disjoint latency range."""
+    values = sorted(latencies_ms)
+    histogram = []
+    lower = 0
+    for upper in LATENCY_BUCKETS_MS + [None]:
+        count = sum(1 for v in values if v >= lower and (upper is None or v < upper))
+        histogram.append({"from_ms": lower, "to_ms": upper, "count": count})
+        lower = upper
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1) if values else 0.0,
+        "p50": round(percentile(values, 50), 1),
+        "p90": round(percentile(values, 90), 1),
+        "p99": round(percentile(values, 99), 1),
+        "max": round(values[-1], 1) if values else 0.0,
+        "histogram": histogram,
+    }
+
+
+def throughput_timeline(completions_per_second):
+    """Texts completed per time bucket, merged so there are at most MAX_TIMELINE_POINTS buckets."""
+    if not completions_per_second:
+        return {"bucket_seconds": 1, "points": []}
+    span = max(completions_per_second) + 1
+    bucket = max(1, -(-span // MAX_TIMELINE_POINTS))
+    points = [0] * (-(-span // bucket))
+    for second, count in completions_per_second.items():
+        points[second // bucket] += count
+    return {
+        "bucket_seconds": bucket,
+        "points": [{"t": i * bucket, "texts": n, "per_second": round(n / bucket, 2)} for i, n in enumerate(points)],
+    }
+
+
+def _bar_chart(items, width=640, height=160, color="#4ECDC4"):
+    """Inline SVG bar chart for [(label, value)]."""
+    if not items:
+        return "<p class='muted'>No data.</p>"
+    peak = max(v for _, v in items) or 1
+    bar_w = width / len(items)
+    bars = []
+    for i, (label, value) in enumerate(items):
+        h = (height - 20) * value / peak
+        x = i * bar_w
+        bars.append(
+            f"<rect x='{x + 1:.1f}' y='{height - 20 - h:.1f}' width='{max(bar_w - 2, 1):.1f}' height='{h:.1f}' fill='{color}'>"
+            f"<title>{html.escape(str(label))}: {value}</title></rect>"
+        )
+    first, last = html.escape(str(items[0][0])), html.escape(str(items[-1][0]))
+    return (f"<svg width='{width}' height='{height}' class='chart'>{''.join(bars)}"
+            f"<text x='0' y='{height - 4}'>{first}</text>"
+            f"<text x='{width}' y='{height - 4}' text-anchor='end'>{last}</text></svg>")
+
+
+def generate_report_html(report, output_html):
+    """Writes a static HTML summary of a run report."""
+    totals = report.get("totals", {})
+    rows = "".join(
+        f"<tr><td>{html.escape(k.replace('_', ' '))}</td><td>{html.escape(str(v))}</td></tr>"
+        for k, v in totals.items()
+    )
+    run_rows = "".join(
+        f"<tr><td>{html.escape(k.replace('_', ' '))}</td><td>{html.escape(str(v))}</td></tr>"
+        for k, v in report.get("run", {}).items()
+    )
+
+    sections = []
+    latency = report.get("latency_ms")
+    if latency:
+        hist = [(f"{b['from_ms']}-{b['to_ms'] if b['to_ms'] is not None else '∞'} ms", b["count"]) for b in latency["histogram"]]
+        sections.append(
+            f"<h2>Request latency</h2><p>p50 {latency['p50']} ms · p90 {latency['p90']} ms · "
+            f"p99 {latency['p99']} ms · max {latency['max']} ms ({latency['count']} calls)</p>{_bar_chart(hist)}"
+        )
+    timeline = report.get("throughput")
+    if timeline and timeline.get("points"):
+        points = [(f"{p['t']}s", p["per_second"]) for p in timeline["points"]]
+        sections.append(f"<h2>Throughput (texts/s, {timeline['bucket_seconds']}s buckets)</h2>{_bar_chart(points, color='#45B7D1')}")
+    errors = report.get("errors_by_class")
+    if errors:
+        err_rows = "".join(f"<tr><td>{html.escape(k)}</td><td>{v}</td></tr>" for k, v in sorted(errors.items(), key=lambda kv: -kv[1]))
+        sections.append(f"<h2>Errors by class</h2><table>{err_rows}</table>")
+
+    html_content = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Run Report</title>
+    <style>
+        body {{ font-family: sans-serif; margin: 20px; background: #f0f2f5; color: #333; }}
+        .card {{ background: #ffffff; padding: 15px 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); margin-bottom: 15px; }}
+        h1 {{ font-size: 1.4rem; }}
+        h2 {{ font-size: 1.1rem; margin-top: 0; }}
+        table {{ border-collapse: collapse; font-size: 0.9rem; }}
+        td {{ padding: 3px 12px 3px 0; border-bottom: 1px solid #eee; }}
+        .chart text {{ font-size: 10px; fill: #555; }}
+        .muted {{ color: #888; }}
+    </style>
+</head>
+<body>
+    <h1>Run Report</h1>
+    <div class="card"><h2>Run</h2><table>{run_rows}</table></div>
+    <div class="card"><h2>Totals</h2><table>{rows}</table></div>
+    {''.join(f'<div class="card">{s}</div>' for s in sections)}
+</body>
+</html>"""
+
+    with open(output_html, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+
+def write_run_report(report, base_path):
+    """Writes <base_path>.json and <base_path>.html. Returns the JSON path."""
+    report.setdefault("generated_at", time.strftime("%Y-%m-%d %H:%M:%S"))
+    json_path = base_path + ".json"
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    generate_report_html(report, base_path + ".html")
+    print(f"Run report: {json_path} (+ .html)")
+    return json_path
+
+
+if __name__ == "__main__":
+    import sys
+    # Re-render the HTML for an existing report: python run_report.py report.json [out.html]
+    if len(sys.argv) < 2:
+        print("Usage: python run_report.py <report_json> [output_html]")
+        sys.exit(1)
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    out = sys.argv[2] if len(sys.argv) > 2 else sys.argv[1].rsplit(".", 1)[0] + ".html"
+    generate_report_html(data, out)
+    print(f"Report HTML generated: {out}")
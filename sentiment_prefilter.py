@@ -0,0 +1,166 @@
+import json
+import os
+import re
+
+# Local lexicon tier: short, obviously polar comments are scored in-process and
+# only ambiguous ones are escalated to the LLM.
+DEFAULT_THRESHOLD = 0.75
+MAX_PREFILTER_CHARS = 280
+
+POSITIVE_WORDS = {
+    "amazing", "awesome", "best", "boom", "booming", "breakout", "bull", "bullish",
+    "cheap", "consistent", "excellent", "fantastic", "gain", "gains", "good", "great",
+    "growth", "happy", "king", "love", "monster", "moon", "outperform", "outperforming",
+    "profit", "profitable", "profits", "rally", "rallying", "recover", "recovery",
+    "safe", "safest", "soar", "soaring", "solid", "strong", "stronger", "surge",
+    "undervalued", "upside", "win", "winner", "winning", "wonderful",
+}
+
+NEGATIVE_WORDS = {
+    "awful", "bad", "bankrupt", "bear", "bearish", "bomb", "casino", "collapse",
+    "crash", "crashing", "dangerous", "destroyed", "disaster", "dump", "dumping",
+    "expensive", "fail", "failing", "fear", "fears", "fraud", "gamble", "hate",
+    "hurting", "insane", "kill", "killing", "lose", "loss", "losses", "lost",
+    "overvalued", "pain", "plunge", "poor", "recession", "risky", "scam", "squeezed",
+    "terrible", "weak", "weakening", "weakness", "worse", "worst", "worthless",
+}
+
+NEGATORS = {"not", "no", "never", "don't", "dont", "isn't", "isnt", "wasn't", "aren't", "won't", "can't", "nothing"}
+INTENSIFIERS = {"very", "really", "absolutely", "extremely", "super", "totally", "so", "way"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def score_sentiment_locally(comment):
+    """
+    Scores a comment with the local lexicon.
+    Returns the same keys as the LLM ('sentiment', 'score', 'reason') plus a
+    'confidence' in [0, 1] used to decide whether to escalate. As for the LLM,
+    'score' is the strength of the sentiment (0.0-1.0), not its direction.
+    """
+    text = (comment or "").strip()
+    if not text or len(text) > MAX_PREFILTER_CHARS:
+        return {"sentiment": "neutral", "score": 0.0, "reason": "Not eligible for local scoring", "confidence": 0.0}
+
+    tokens = _TOKEN_RE.findall(text.lower())
+    pos_hits, neg_hits = [], []
+    polarity = 0.0
+    magnitude = 0.0
+    for i, tok in enumerate(tokens):
+        if tok in POSITIVE_WORDS:
+            weight = 1.0
+        elif tok in NEGATIVE_WORDS:
+            weight = -1.0
+        else:
+            continue
+        window = tokens[max(0, i - 3):i]
+        if any(w in NEGATORS for w in window):
+            weight = -weight
+        if i > 0 and tokens[i - 1] in INTENSIFIERS:
+            weight *= 1.5
+        polarity += weight
+        magnitude += abs(weight)
+        (pos_hits if weight > 0 else neg_hits).append(tok)
+
+    hits = len(pos_hits) + len(neg_hits)
+    if hits == 0:
+        return {"sentiment": "neutral", "score": 0.0, "reason": "No lexicon terms found", "confidence": 0.0}
+
+    # Agreement between hits drives confidence; mixed signals or a question cap it.
+    # A lone term ("insane", "pain") stays below DEFAULT_THRESHOLD: it takes a
+    # second, agreeing term to skip the LLM.
+    agreement = abs(polarity) / magnitude
+    confidence = min(1.0, agreement * (0.4 + 0.3 * min(hits, 2)))
+    if "?" in text:
+        confidence *= 0.7
+
+    if polarity > 0:
+        sentiment = "positive"
+    elif polarity < 0:
+        sentiment = "negative"
+    else:
+        sentiment = "neutral"
+        confidence = 0.0
+    score = round(min(1.0, 0.4 + 0.2 * abs(polarity)), 3) if sentiment != "neutral" else 0.0
+
+    terms = ", ".join(pos_hits + neg_hits)
+    return {
+        "sentiment": sentiment,
+        "score": score,
+        "reason": f"Local lexicon match: {terms}",
+        "confidence": round(confidence, 3),
+    }
+
+
+def resolve_locally(comment, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns the local result (with 'source': 'local') when its confidence meets
+    `threshold`, otherwise None: the comment needs the LLM.
+    """
+    local = score_sentiment_locally(comment)
+    if local["confidence"] >= threshold:
+        local["source"] = "local"
+        return local
+    return None
+
+
+def calibrate_prefilter(session, comments, analyze_fn, report_file,
+                        thresholds=(0.5, 0.6, 0.7, 0.75, 0.8, 0.9)):
+    """
+    Runs both tiers on every comment and writes a JSON calibration report with
+    LLM agreement and escalation rate for each candidate threshold.
+    """
+    pairs = []
+    for i, comment in enumerate(comments):
+        print(f"[{i+1}/{len(comments)}] Calibrating...")
+        local = score_sentiment_locally(comment)
+        llm = analyze_fn(session, comment)
+        llm_sentiment = str(llm.get("sentiment", "")).lower()
+        if llm_sentiment in ("error", "skipped", ""):
+            continue
+        pairs.append((local["confidence"], local["sentiment"], llm_sentiment))
+
+    total = len(pairs)
+    by_threshold = []
+    for t in thresholds:
+        accepted = [p for p in pairs if p[0] >= t]
+        agree = sum(1 for p in accepted if p[1] == p[2])
+        by_threshold.append({
+            "threshold": t,
+            "accepted_locally": len(accepted),
+            "llm_calls_saved_pct": round(100.0 * len(accepted) / total, 1) if total else 0.0,
+            "agreement_pct": round(100.0 * agree / len(accepted), 1) if accepted else None,
+        })
+
+    report = {
+        "compared": total,
+        "overall_agreement_pct": round(100.0 * sum(1 for p in pairs if p[1] == p[2]) / total, 1) if total else None,
+        "thresholds": by_threshold,
+    }
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Calibration report saved to {report_file}")
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    # Example usage: python sentiment_prefilter.py input.csv [report.json] [limit]
+    if len(sys.argv) < 2:
+        print("Usage: python sentiment_prefilter.py <input_csv> [report_json] [limit]")
+        sys.exit(1)
+
+    from analysis_engine import read_texts
+    from process_sentiment_v2 import analyze_sentiment, setup_requests_session
+
+    inp = sys.argv[1]
+    report = sys.argv[2] if len(sys.argv) > 2 else "prefilter_calibration.json"
+    lim = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    if not os.path.exists(inp):
+        print(f"File {inp} not found.")
+        sys.exit(1)
+
+    texts = [t for t in read_texts(inp, ['body', 'comments', 'comment', 'text'], limit=lim) if t.strip()]
+    calibrate_prefilter(setup_requests_session(), texts, analyze_sentiment, report)
@@ -0,0 +1,129 @@
+import csv
+
+from analysis_engine import _output_rows, _rewrite_rows, combine_tasks, extract_json, salvage_json, split_result
+
+
+def test_salvage_keeps_complete_members_only():
+    text = '{"sentiment": "positive", "score": 0.8, "summary": "cut he'
+    assert salvage_json(text) == {"sentiment": "positive", "score": 0.8}
+
+
+def test_salvage_drops_truncated_array_element():
+    text = 'Here: {"sentiment": "negative", "entities": [{"text": "A", "label": "Org"}, {"text": "B", "la'
+    assert salvage_json(text) == {"sentiment": "negative", "entities": [{"text": "A", "label": "Org"}]}
+
+
+def test_salvage_drops_truncated_nested_member():
+    assert salvage_json('{"a": "x, y", "d": [1, 2') == {"a": "x, y"}
+    assert salvage_json('{"a": 1, "p": {"positive": 0.6, "neg') == {"a": 1}
+
+
+def test_salvage_ignores_brackets_and_commas_in_strings():
+    text = '{"a": "[x, {y}", "b": "q\\", z", "c": "tru'
+    assert salvage_json(text) == {"a": "[x, {y}", "b": 'q", z'}
+
+
+def test_salvage_gives_up_without_a_complete_member():
+    assert salvage_json('{"sentiment": "neg') is None
+    assert salvage_json("no json here") is None
+
+
+def test_salvage_of_complete_output_matches_extract_json():
+    text = 'Result: {"a": 1, "b": [{"c": 2}]} done'
+    assert salvage_json(text) == extract_json(text) == {"a": 1, "b": [{"c": 2}]}
+
+
+def _write(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+
+
+def _read(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_rewrite_rows_replaces_spans(tmp_path):
+    path = str(tmp_path / "out.csv")
+    _write(path, [["text", "label"], ["a", "error"], ["b1", "x"], ["b2", "y"], ["c", "error"], ["d", "z"]])
+
+    _rewrite_rows(path, ["text", "label"], {
+        0: (1, [{"text": "a", "label": "ok1"}, {"text": "a", "label": "ok2"}]),
+        3: (1, [{"text": "c", "label": "ok"}]),
+    })
+
+    assert _read(path) == [["text", "label"], ["a", "ok1"], ["a", "ok2"], ["b1", "x"], ["b2", "y"],
+                           ["c", "ok"], ["d", "z"]]
+
+
+def test_rewrite_rows_shrinks_multi_row_span_and_keeps_multiline_fields(tmp_path):
+    path = str(tmp_path / "out.csv")
+    _write(path, [["text", "label"], ["line one\nline two", "x"], ["e", "error"], ["e", "error"], ["f", "y"]])
+
+    _rewrite_rows(path, ["text", "label"], {1: (2, [{"text": "e", "label": "ok"}])})
+
+    assert _read(path) == [["text", "label"], ["line one\nline two", "x"], ["e", "ok"], ["f", "y"]]
+    assert not (tmp_path / "out.csv.tmp").exists()
+
+
+def _task(name, keys, columns, prepare=lambda text: text.strip(), postprocess=None):
+    task = {
+        "name": name, "system_prompt": f"{name} prompt", "user_template": "{text}", "temperature": 0.1,
+        "max_tokens": 100, "timeout": 30, "columns": columns, "keep_empty": False, "prepare": prepare,
+        "skip_result": lambda text: {"skipped": name}, "parse": extract_json,
+        "error_result": lambda reason: {"error": reason}, "is_error": lambda result: "error" in result,
+        "fieldnames": keys, "keys": keys, "key_hints": {key: '"string"' for key in keys},
+    }
+    if postprocess:
+        task["postprocess"] = postprocess
+    return task
+
+
+def _entities_flat(text, result):
+    result["entities_flat"] = "; ".join(e["text"] for e in result.get("entities", []))
+    return result
+
+
+def test_combine_tasks_takes_columns_from_base_and_applies_every_prepare():
+    lite = _task("lite", ["sentiment"], ["comments"], prepare=lambda text: text.strip()[:10])
+    full = _task("full", ["sentiment", "entities"], ["body"], postprocess=_entities_flat)
+    for tasks in ([lite, full], [full, lite]):
+        combined = combine_tasks(tasks)
+        assert combined["columns"] == ["body"]
+        assert combined["prepare"]("  " + "x" * 20) == "x" * 10
+        assert combined["prepare"]("   ") == ""
+        assert '"entities"' not in combined["system_prompt"]
+
+
+def test_split_result_runs_each_postprocess_on_its_own_copy():
+    lite = _task("lite", ["sentiment"], ["comments"])
+    full = _task("full", ["sentiment", "entities"], ["body"], postprocess=_entities_flat)
+    combined = combine_tasks([lite, full])
+    result = {"sentiment": "positive", "entities": [{"text": "NVDA"}]}
+
+    split = split_result(combined, "text", result)
+
+    assert split["lite"] == result
+    assert split["full"]["entities_flat"] == "NVDA"
+    assert "entities_flat" not in result
+    assert split_result(combined, "", {"_skipped": True}) == {"lite": {"skipped": "lite"}, "full": {"skipped": "full"}}
+    assert split_result(combined, "text", {"_error": "boom"}) == {"lite": {"error": "boom"}, "full": {"error": "boom"}}
+
+
+def test_combined_postprocess_flags_output_a_task_cannot_handle():
+    lite = _task("lite", ["sentiment"], ["comments"])
+    full = _task("full", ["sentiment", "entities"], ["body"], postprocess=_entities_flat)
+    combined = combine_tasks([lite, full])
+
+    processed = combined["postprocess"]("text", {"sentiment": "positive", "entities": ["NVDA"]})
+
+    assert processed["error_class"] == "parse"
+    assert processed["_split"]["lite"] == {"sentiment": "positive", "entities": ["NVDA"]}
+    assert processed["_split"]["full"]["error_class"] == "parse"
+
+
+def test_output_rows_mark_partial_results():
+    task = _task("lite", ["sentiment"], ["comments"])
+    task["flatten"] = lambda text, result: [{"text": text, "sentiment": result.get("sentiment")}]
+    assert _output_rows(task, "a", {"sentiment": "positive"}) == [{"text": "a", "sentiment": "positive", "error_class": ""}]
+    assert _output_rows(task, "b", {"sentiment": "negative", "error_class": "salvaged"})[0]["error_class"] == "salvaged"
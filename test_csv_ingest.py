@@ -0,0 +1,64 @@
+import csv
+import random
+
+import pytest
+
+from csv_ingest import iter_chunks, iter_rows, read_column
+
+CHUNK_SIZES = [16, 64, 100, 256, 1000, 4096, 10 ** 7]
+
+
+def _expected(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.reader(f))
+
+
+@pytest.fixture
+def tricky_csv(tmp_path):
+    """Multi-line quoted bodies, escaped quotes and a stray quote in an unquoted field."""
+    path = tmp_path / "tricky.csv"
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "body"])
+        for i in range(200):
+            if i == 3:
+                f.write('3,5" screen\n')
+            elif i % 3 == 0:
+                writer.writerow([i, 'line a\nline "b", c\nend'])
+            else:
+                writer.writerow([i, f"plain {i}, é"])
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_bytes", CHUNK_SIZES)
+def test_rows_match_csv_reader(tricky_csv, chunk_bytes):
+    assert [list(r) for r in iter_rows(tricky_csv, chunk_bytes)] == _expected(tricky_csv)
+
+
+@pytest.mark.parametrize("chunk_bytes", CHUNK_SIZES)
+def test_chunks_end_on_record_boundaries(tricky_csv, chunk_bytes):
+    chunks = list(iter_chunks(tricky_csv, chunk_bytes))
+    assert "".join(chunks) == open(tricky_csv, newline='', encoding='utf-8').read()
+    for chunk in chunks[:-1]:
+        assert chunk.endswith("\n")
+
+
+@pytest.mark.parametrize("chunk_bytes", CHUNK_SIZES)
+def test_random_quoting_matches_csv_reader(tmp_path, chunk_bytes):
+    rng = random.Random(5)
+    path = tmp_path / "fuzz.csv"
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for i in range(500):
+            if rng.random() < 0.1:
+                f.write(f'{i},5" screen,x"y\n')
+            else:
+                writer.writerow(["".join(rng.choice('ab ,"\n\r') for _ in range(rng.randint(0, 12))) for _ in range(3)])
+    assert [list(r) for r in iter_rows(str(path), chunk_bytes)] == _expected(str(path))
+
+
+def test_bom_and_missing_trailing_newline(tmp_path):
+    path = tmp_path / "bom.csv"
+    path.write_bytes('﻿body,x\n"multi\nline",1\nlast,2'.encode('utf-8'))
+    assert [list(r) for r in iter_rows(str(path), 8)] == [["body", "x"], ["multi\nline", "1"], ["last", "2"]]
+    assert read_column(str(path), "body", chunk_bytes=8) == ["multi\nline", "last"]